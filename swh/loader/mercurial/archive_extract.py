@@ -3,13 +3,47 @@
 # License: GNU General Public License version 3, or any later version
 # See top-level LICENSE file for more information
 
+from contextlib import contextmanager
 import os
 import shutil
+import tarfile
 import tempfile
 
 import patoolib
 
 
+def _unpack_format(archive):
+    """Return the name of the :mod:`shutil` unpack format registered for the
+    archive extension, or None when there is none."""
+    for name, extensions, _ in shutil.get_unpack_formats():
+        if any(archive.endswith(extension) for extension in extensions):
+            return name
+    return None
+
+
+def extract(archive, outdir):
+    """Extract an archive in the given directory.
+
+    Zip files, and tarballs when the tarfile "data" extraction filter is available,
+    are extracted in-process, without spawning an external archiver. Other formats
+    fall back to patool.
+
+    Args:
+        archive (string): Absolute path of the archive to be extracted
+        outdir (string): Directory in which to extract the archive
+    """
+    unpack_format = _unpack_format(archive)
+    if unpack_format == "zip":
+        # members with absolute paths or ".." components are skipped
+        shutil.unpack_archive(archive, outdir, unpack_format)
+    elif unpack_format is not None and hasattr(tarfile, "data_filter"):
+        # the "data" filter refuses members escaping outdir, like GNU tar does
+        shutil.unpack_archive(archive, outdir, unpack_format, filter="data")
+    else:
+        patoolib.extract_archive(archive, interactive=False, outdir=outdir)
+
+
+@contextmanager
 def tmp_extract(archive, dir=None, prefix=None, suffix=None, log=None, source=None):
     """Extract an archive to a temporary location with optional logs.
 
@@ -36,21 +70,21 @@ def tmp_extract(archive, dir=None, prefix=None, suffix=None, log=None, source=No
     else:
         package = archive_base.split(".")[0]
 
-    tmpdir = tempfile.mkdtemp(dir=dir, prefix=prefix, suffix=suffix)
-    repo_path = os.path.join(tmpdir, package)
-    try:
-        patoolib.extract_archive(archive, interactive=False, outdir=tmpdir)
-    except Exception as e:
-        if os.path.exists(tmpdir):
-            shutil.rmtree(tmpdir)
-        msg = "%sFailed to uncompress archive %s at %s - %s" % (
-            logstr,
-            archive_base,
-            repo_path,
-            e,
-        )
-        raise ValueError(msg)
-
-    if log:
-        log.info("%sUncompressing archive %s at %s" % (logstr, archive_base, repo_path))
-    return tmpdir
+    with tempfile.TemporaryDirectory(dir=dir, prefix=prefix, suffix=suffix) as tmpdir:
+        repo_path = os.path.join(tmpdir, package)
+        try:
+            extract(archive, tmpdir)
+        except Exception as e:
+            msg = "%sFailed to uncompress archive %s at %s - %s" % (
+                logstr,
+                archive_base,
+                repo_path,
+                e,
+            )
+            raise ValueError(msg)
+
+        if log:
+            log.info(
+                "%sUncompressing archive %s at %s" % (logstr, archive_base, repo_path)
+            )
+        yield tmpdir
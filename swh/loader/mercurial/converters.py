@@ -3,9 +3,13 @@
 # License: GNU General Public License version 3, or any later version
 # See top-level LICENSE file for more information
 
+import re
 
 PRIMARY_ALGO = "sha1_git"
 
+# name (without a single trailing space), then an optional email between brackets
+AUTHOR_PATTERN = re.compile(rb"([^<]*?)( ?)<(?:([^>]*)>)?")
+
 
 def parse_author(name_email):
     """Parse an author line"""
@@ -13,27 +17,12 @@ def parse_author(name_email):
     if name_email is None:
         return None
 
-    try:
-        open_bracket = name_email.index(b"<")
-    except ValueError:
+    match = AUTHOR_PATTERN.match(name_email)
+    if match is None:
         name = email = None
     else:
-        raw_name = name_email[:open_bracket]
-        raw_email = name_email[open_bracket + 1 :]
-
-        if not raw_name:
-            name = None
-        elif raw_name.endswith(b" "):
-            name = raw_name[:-1]
-        else:
-            name = raw_name
-
-        try:
-            close_bracket = raw_email.index(b">")
-        except ValueError:
-            email = None
-        else:
-            email = raw_email[:close_bracket]
+        raw_name, space, email = match.groups()
+        name = raw_name if raw_name or space else None
 
     return {
         "name": name,
@@ -112,10 +112,19 @@ def branching_info(repo: hg.localrepo, ignored: Set[int]) -> BranchingInfo:
     )
 
 
-def clone(src: str, dest: str, timeout: float = 7200, rev: Optional[str] = None):
+def clone(
+    src: str,
+    dest: str,
+    timeout: float = 7200,
+    rev: Optional[str] = None,
+    update: bool = True,
+):
     """Clone a hg repository `src` in `dest`. Optionally, this can clone at the specific
     revision if provided.
 
+    When `update` is False, only the repository store is fetched and no working
+    directory is checked out.
+
     Raises:
         CloneFailure: when there is an issue during the cloning step
 
@@ -126,7 +135,7 @@ def clone(src: str, dest: str, timeout: float = 7200, rev: Optional[str] = None)
         peeropts={},
         source=src.encode(),
         dest=dest.encode(),
-        update=True,
+        update=update,
         revs=None if not rev else [rev.encode()],
     )
     clone_with_timeout(src, dest, closure, timeout)
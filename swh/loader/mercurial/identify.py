@@ -4,6 +4,7 @@
 # See top-level LICENSE file for more information
 
 from codecs import escape_decode
+from functools import lru_cache
 import json
 from pathlib import Path
 import re
@@ -37,6 +38,7 @@ class HgAuthor(NamedTuple):
     """email of the author"""
 
     @staticmethod
+    @lru_cache(maxsize=4096)
     def from_bytes(data: bytes) -> "HgAuthor":
         """Convert bytes to an HgAuthor named tuple.
 
@@ -108,14 +110,13 @@ class HgRevision(NamedTuple):
         '''
 
         """
-        lines = data.split(b"\n")
-        tuples = [line.split(b":", 1) for line in lines]
         fields: Dict[str, Any] = {
             "parents": [],
             "extras": {},
             "description": description,
         }
-        for key, value in tuples:
+        for line in data.split(b"\n"):
+            key, _, value = line.partition(b":")
             if key == b"timestamp_offset":
                 timestamp, offset = json.loads(value)
                 fields["timestamp"] = timestamp
@@ -141,7 +142,7 @@ class HgRevision(NamedTuple):
         date = normalize_timestamp(int(self.timestamp))
 
         extra_headers = [
-            (b"time_offset_seconds", str(self.offset).encode("utf-8")),
+            (b"time_offset_seconds", b"%d" % self.offset),
         ]
 
         for key, value in self.extras.items():
@@ -223,17 +224,23 @@ class Hg:
 
         If no revision range is specified, return all revisions".
         """
+        # Retrieve all the revisions in a single `hg log` call,
+        # each revision data is terminated by a NUL byte
+        template = HG_REVISION_TEMPLATE + "\\0"
         if rev:
-            node_ids = self._output("log", "-r", rev, "-T", "{node}\n").splitlines()
+            output = self._output("log", "-r", rev, "-T", template)
         else:
-            node_ids = self._output("log", "-T", "{node}\n").splitlines()
+            output = self._output("log", "-T", template)
 
-        revisions = [self._revision(node_id) for node_id in reversed(node_ids)]
+        revisions = [
+            self._revision(data) for data in reversed(output.split(b"\0")[:-1])
+        ]
 
         return revisions
 
-    def _revision(self, revision: bytes) -> HgRevision:
-        data = self._output("log", "-r", revision, "-T", HG_REVISION_TEMPLATE)
+    def _revision(self, data: bytes) -> HgRevision:
+        # data starts with the `node_id:{node}` line of HG_REVISION_TEMPLATE
+        revision = data[len(b"node_id:") : data.index(b"\n")]
 
         # hg log strips the description so the raw description has to be taken
         # from debugdata
@@ -10,10 +10,12 @@
 """
 
 from collections import deque
+from contextlib import ExitStack
 from datetime import datetime
+from functools import lru_cache
 import os
 from shutil import rmtree
-from tempfile import mkdtemp
+from tempfile import gettempdir, mkdtemp
 from typing import (
     Any,
     Deque,
@@ -69,6 +71,14 @@ EXTID_VERSION: int = 1
 T = TypeVar("T")
 
 
+@lru_cache(maxsize=4096)
+def _person_from_fullname(fullname: bytes) -> Person:
+    """Cached :meth:`Person.from_fullname`, the same few authors usually appear
+    in most revisions of a repository. `Person` is immutable so instances are
+    safely shared between revisions."""
+    return Person.from_fullname(fullname)
+
+
 class CorruptedRevision(ValueError):
     """Raised when a revision is corrupted."""
 
@@ -98,14 +108,21 @@ class HgDirectory(Directory):
             super().__setitem__(path, value)
 
     def __delitem__(self, path: bytes) -> None:
-        super().__delitem__(path)
+        *dir_names, name = path.split(b"/")
+
+        # walk down the path only once, instead of looking up each parent
+        # directory from the root again
+        directories = [self]
+        for dir_name in dir_names:
+            directories.append(directories[-1][dir_name])
 
-        while b"/" in path:  # remove empty parent directories
-            path = path.rsplit(b"/", 1)[0]
-            if len(self[path]) == 0:
-                super().__delitem__(path)
-            else:
-                break
+        parent = directories.pop()
+        Directory.__delitem__(parent, name)
+
+        while dir_names and len(parent) == 0:  # remove empty parent directories
+            name = dir_names.pop()
+            parent = directories.pop()
+            Directory.__delitem__(parent, name)
 
     def get(
         self, path: bytes, default: Optional[T] = None
@@ -156,7 +173,7 @@ class HgLoader(BaseLoader):
         url: str,
         directory: Optional[str] = None,
         visit_date: Optional[datetime] = None,
-        temp_directory: str = "/tmp",
+        temp_directory: Optional[str] = None,
         clone_timeout_seconds: int = 7200,
         content_cache_size: int = 10_000,
         **kwargs: Any,
@@ -168,11 +185,13 @@ class HgLoader(BaseLoader):
             directory: directory of the local repository.
             logging_class: class of the loader logger.
             visit_date: visit date of the repository
+            temp_directory: parent directory of the temporary clones, defaults to
+                the system temporary directory (honors ``TMPDIR``)
             config: loader configuration
         """
         super().__init__(storage=storage, origin_url=url, **kwargs)
 
-        self._temp_directory = temp_directory
+        self._temp_directory = temp_directory or gettempdir()
         self._clone_timeout = clone_timeout_seconds
 
         self.visit_date = visit_date or self.visit_date
@@ -277,28 +296,19 @@ class HgLoader(BaseLoader):
     def _get_extids_for_targets(self, targets: List[Sha1Git]) -> List[ExtID]:
         """Get all Mercurial ExtIDs for the targets in the latest snapshot"""
         extids = []
-        for extid in self.storage.extid_get_from_target(
-            swhids.ObjectType.REVISION,
-            targets,
-            extid_type=EXTID_TYPE,
-            extid_version=EXTID_VERSION,
-        ):
-            extids.append(extid)
-            self._revision_nodeid_to_sha1git[HgNodeId(extid.extid)] = (
-                extid.target.object_id
-            )
+        for group_ids in grouper(targets, n=1000):
+            for extid in self.storage.extid_get_from_target(
+                swhids.ObjectType.REVISION,
+                list(group_ids),
+                extid_type=EXTID_TYPE,
+                extid_version=EXTID_VERSION,
+            ):
+                extids.append(extid)
+                self._revision_nodeid_to_sha1git[HgNodeId(extid.extid)] = (
+                    extid.target.object_id
+                )
 
-        if extids:
-            # Filter out dangling extids, we need to load their target again
-            revisions_missing = self.storage.revision_missing(
-                [extid.target.object_id for extid in extids]
-            )
-            extids = [
-                extid
-                for extid in extids
-                if extid.target.object_id not in revisions_missing
-            ]
-        return extids
+        return self._filter_dangling_extids(extids)
 
     def _get_extids_for_hgnodes(self, hgnode_ids: List[HgNodeId]) -> List[ExtID]:
         """Get all Mercurial ExtIDs for the mercurial nodes in the list which point to
@@ -309,24 +319,29 @@ class HgLoader(BaseLoader):
 
         for group_ids in grouper(hgnode_ids, n=1000):
             for extid in self.storage.extid_get_from_extid(
-                EXTID_TYPE, group_ids, version=EXTID_VERSION
+                EXTID_TYPE, list(group_ids), version=EXTID_VERSION
             ):
                 extids.append(extid)
                 self._revision_nodeid_to_sha1git[HgNodeId(extid.extid)] = (
                     extid.target.object_id
                 )
 
-        if extids:
-            # Filter out dangling extids, we need to load their target again
-            revisions_missing = self.storage.revision_missing(
-                [extid.target.object_id for extid in extids]
-            )
-            extids = [
-                extid
-                for extid in extids
-                if extid.target.object_id not in revisions_missing
-            ]
-        return extids
+        return self._filter_dangling_extids(extids)
+
+    def _filter_dangling_extids(self, extids: List[ExtID]) -> List[ExtID]:
+        """Filter out dangling extids, we need to load their target again.
+
+        Targets are checked against the storage in batches to keep each request
+        small on repositories with many revisions.
+        """
+        targets = [extid.target.object_id for extid in extids]
+        revisions_missing: Set[Sha1Git] = set()
+        for group_ids in grouper(targets, n=1000):
+            revisions_missing.update(self.storage.revision_missing(list(group_ids)))
+
+        return [
+            extid for extid in extids if extid.target.object_id not in revisions_missing
+        ]
 
     def fetch_data(self) -> bool:
         """Fetch the data from the source the loader is currently loading
@@ -347,7 +362,14 @@ class HgLoader(BaseLoader):
                 f"with timeout {self._clone_timeout} seconds"
             )
             with raise_not_found_repository():
-                hgutil.clone(self.origin.url, self._repo_directory, self._clone_timeout)
+                # The loader only reads the repository store, checking out a
+                # working directory would just write every file to disk.
+                hgutil.clone(
+                    self.origin.url,
+                    self._repo_directory,
+                    self._clone_timeout,
+                    update=False,
+                )
         else:  # existing local repository
             # Allow to load on disk repository without cloning
             # for testing purpose.
@@ -394,7 +416,8 @@ class HgLoader(BaseLoader):
         # 2. Then filter out remaining revisions through the overall extid mappings
         # across hg origins
         revs_left = repo.revs("all() - ::(%ld)", seen_revs)
-        hg_nodeids = [repo[nodeid].node() for nodeid in revs_left]
+        node = repo.changelog.node
+        hg_nodeids = [node(rev) for rev in revs_left]
         if hg_nodeids:
             # Don't filter revs if there are none, otherwise it'll load
             # everything
@@ -546,16 +569,15 @@ class HgLoader(BaseLoader):
         Returns:
             the sha1_git of the parent revisions.
         """
-        parents = []
-        for parent_ctx in rev_ctx.parents():
-            parent_hg_nodeid = parent_ctx.node()
+        repo: hgutil.Repository = self._repo  # mypy can't infer that repo is not None
+        # read the parent nodeids straight from the changelog index instead of
+        # building a context for each parent
+        return tuple(
+            self.get_revision_id_from_hg_nodeid(parent_hg_nodeid)
+            for parent_hg_nodeid in repo.changelog.parents(rev_ctx.node())
             # nullid is the value of a parent that does not exist
-            if parent_hg_nodeid == hgutil.NULLID:
-                continue
-            revision_id = self.get_revision_id_from_hg_nodeid(parent_hg_nodeid)
-            parents.append(revision_id)
-
-        return tuple(parents)
+            if parent_hg_nodeid != hgutil.NULLID
+        )
 
     def store_revision(self, rev_ctx: hgutil.BaseContext) -> None:
         """Store a revision given its hg nodeid.
@@ -572,7 +594,7 @@ class HgLoader(BaseLoader):
 
         # `Person.from_fullname` is compatible with mercurial's freeform author
         # as fullname is what is used in revision hash when available.
-        author = Person.from_fullname(rev_ctx.user())
+        author = _person_from_fullname(rev_ctx.user())
 
         (timestamp, offset) = rev_ctx.date()
 
@@ -583,7 +605,7 @@ class HgLoader(BaseLoader):
         extra_headers = [
             (
                 b"time_offset_seconds",
-                str(offset).encode(),
+                b"%d" % offset,
             ),
         ]
         for key, value in rev_ctx.extra().items():
@@ -671,7 +693,6 @@ class HgLoader(BaseLoader):
         Returns:
             the sha1_git of the top level directory.
         """
-        hg_nodeid = rev_ctx.node()
         file_ctx = rev_ctx[file_path]
 
         try:
@@ -685,13 +706,15 @@ class HgLoader(BaseLoader):
             # Another option could be to just ignore the missing content.
             # This point is left to future commits.
             # Check for other uses to apply the same logic there.
-            raise CorruptedRevision(hg_nodeid)
+            raise CorruptedRevision(rev_ctx.node())
 
         perms = FLAG_PERMS[file_ctx.flags()]
 
-        # Key is file_nodeid + perms because permissions does not participate
-        # in content hash in hg while it is the case in swh.
-        cache_key = (file_nodeid, perms)
+        # Key is only the file_nodeid: the hg filenode is derived from the file
+        # text, so it fully determines the sha1_git. Permissions only matter
+        # for the directory entry built below, keying on them as well would
+        # read and hash the same data again whenever only the flags change.
+        cache_key = file_nodeid
 
         sha1_git = self._content_hash_cache.get(cache_key)
         if sha1_git is None:
@@ -700,7 +723,7 @@ class HgLoader(BaseLoader):
             except hgutil.error.RevlogError:
                 # TODO
                 # See above use of `CorruptedRevision`
-                raise CorruptedRevision(hg_nodeid)
+                raise CorruptedRevision(rev_ctx.node())
 
             content = ModelContent.from_data(data)
 
@@ -713,15 +736,29 @@ class HgLoader(BaseLoader):
         return Content({"sha1_git": sha1_git, "perms": perms})
 
     def _store_tree(self) -> Sha1Git:
-        """Save the current in-memory tree to storage."""
+        """Save the current in-memory tree to storage.
+
+        Only the directories modified since the previous call are saved. Any
+        change in a subtree invalidates the hash of all its ancestors, which also
+        resets their `collected` flag. Directories are stored after their
+        subdirectories and flagged once stored, so a directory still flagged as
+        collected was stored already along with everything below it.
+        """
+        modified: List[Directory] = []
         directories: Deque[Directory] = deque([self._last_root])
         while directories:
             directory = directories.pop()
-            self.storage.directory_add([directory.to_model()])
+            if directory.collected:
+                continue
+            modified.append(directory)
             directories.extend(
                 [item for item in directory.values() if isinstance(item, Directory)]
             )
 
+        for directory in reversed(modified):
+            self.storage.directory_add([directory.to_model()])
+            directory.collected = True
+
         return self._last_root.hash
 
     def _store_directories_slow(self, rev_ctx: hgutil.BaseContext) -> Sha1Git:
@@ -735,9 +772,9 @@ class HgLoader(BaseLoader):
         except hgutil.error.LookupError:
             raise CorruptedRevision(rev_ctx.node())
 
+        root = self._last_root
         for file_path in files:
-            content = self.store_content(rev_ctx, file_path)
-            self._last_root[file_path] = content
+            root[file_path] = self.store_content(rev_ctx, file_path)
 
         self._last_hg_nodeid = rev_ctx.node()
 
@@ -769,19 +806,18 @@ class HgLoader(BaseLoader):
         except hgutil.error.LookupError:
             raise CorruptedRevision(rev_ctx.node())
 
+        root = self._last_root
         for file_path in status.removed:
             try:
-                del self._last_root[file_path]
+                del root[file_path]
             except KeyError:
                 raise CorruptedRevision(rev_ctx.node())
 
         for file_path in status.added:
-            content = self.store_content(rev_ctx, file_path)
-            self._last_root[file_path] = content
+            root[file_path] = self.store_content(rev_ctx, file_path)
 
         for file_path in status.modified:
-            content = self.store_content(rev_ctx, file_path)
-            self._last_root[file_path] = content
+            root[file_path] = self.store_content(rev_ctx, file_path)
 
         self._last_hg_nodeid = rev_ctx.node()
 
@@ -797,7 +833,7 @@ class HgArchiveLoader(HgLoader):
         url: str,
         visit_date: Optional[datetime] = None,
         archive_path: Optional[str] = None,
-        temp_directory: str = "/tmp",
+        temp_directory: Optional[str] = None,
         **kwargs: Any,
     ):
         super().__init__(
@@ -810,18 +846,32 @@ class HgArchiveLoader(HgLoader):
         )
         self.archive_extract_temp_dir = None
         self.archive_path = archive_path
+        # removes the extracted archive on cleanup
+        self._archive_extract_stack = ExitStack()
 
     def prepare(self):
         """Extract the archive instead of cloning."""
-        self.archive_extract_temp_dir = tmp_extract(
-            archive=self.archive_path,
-            dir=self._temp_directory,
-            prefix=TEMPORARY_DIR_PREFIX_PATTERN,
-            suffix=f".dump-{os.getpid()}",
-            log=self.log,
-            source=self.origin.url,
+        self.archive_extract_temp_dir = self._archive_extract_stack.enter_context(
+            tmp_extract(
+                archive=self.archive_path,
+                dir=self._temp_directory,
+                prefix=TEMPORARY_DIR_PREFIX_PATTERN,
+                suffix=f".dump-{os.getpid()}",
+                log=self.log,
+                source=self.origin.url,
+            )
         )
 
-        repo_name = os.listdir(self.temp_dir)[0]
-        self.directory = os.path.join(self.archive_extract_temp_dir, repo_name)
+        with os.scandir(self.archive_extract_temp_dir) as entries:
+            entry = next(entries, None)
+        if entry is None:
+            raise ValueError(f"Archive {self.archive_path} is empty")
+        self.directory = entry.path
         super().prepare()
+
+    def cleanup(self) -> None:
+        """Remove the extracted archive in addition to the default cleanup."""
+        try:
+            super().cleanup()
+        finally:
+            self._archive_extract_stack.close()
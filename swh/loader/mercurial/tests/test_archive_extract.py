@@ -0,0 +1,89 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+import io
+import os
+import tarfile
+from unittest.mock import patch
+
+import pytest
+
+from swh.loader.mercurial.archive_extract import tmp_extract
+
+requires_data_filter = pytest.mark.skipif(
+    not hasattr(tarfile, "data_filter"),
+    reason="tarballs are only extracted in-process with the tarfile data filter",
+)
+
+
+def test_tmp_extract(datadir, tmp_path):
+    archive_path = os.path.join(datadir, "hello.tgz")
+
+    with tmp_extract(archive_path, dir=str(tmp_path), prefix="test-") as tmpdir:
+        assert os.listdir(tmpdir) == ["hello"]
+        assert os.path.isdir(os.path.join(tmpdir, "hello", ".hg"))
+
+    assert not os.path.exists(tmpdir)
+
+
+def test_tmp_extract_invalid_archive(datadir, tmp_path):
+    archive_path = os.path.join(datadir, "hello.json")
+
+    with pytest.raises(ValueError, match="Failed to uncompress archive"):
+        with tmp_extract(archive_path, dir=str(tmp_path), prefix="test-"):
+            pass
+
+    assert os.listdir(tmp_path) == []
+
+
+@requires_data_filter
+def test_tmp_extract_path_traversal(tmp_path):
+    archive_path = str(tmp_path / "evil.tgz")
+    with tarfile.open(archive_path, "w:gz") as tar:
+        data = b"escaped"
+        member = tarfile.TarInfo("../escaped")
+        member.size = len(data)
+        tar.addfile(member, io.BytesIO(data))
+
+    extract_dir = tmp_path / "extract"
+    with pytest.raises(ValueError, match="Failed to uncompress archive"):
+        with tmp_extract(archive_path, dir=str(extract_dir), prefix="test-"):
+            pass
+
+    assert not (extract_dir / "escaped").exists()
+    assert os.listdir(extract_dir) == []
+
+
+def test_tmp_extract_fallback_to_patool(tmp_path):
+    archive_path = str(tmp_path / "hello.7z")
+
+    with patch("patoolib.extract_archive") as extract_archive:
+        with tmp_extract(archive_path, dir=str(tmp_path), prefix="test-") as tmpdir:
+            extract_archive.assert_called_once_with(
+                archive_path, interactive=False, outdir=tmpdir
+            )
+
+
+@requires_data_filter
+@pytest.mark.parametrize(
+    "corrupt",
+    [lambda data: data[: len(data) // 2], lambda data: b"\0" * 16 + data[16:]],
+    ids=["truncated", "bad-header"],
+)
+def test_tmp_extract_corrupted_archive_no_fallback(datadir, tmp_path, corrupt):
+    with open(os.path.join(datadir, "hello.tgz"), "rb") as f:
+        data = f.read()
+    archive_path = str(tmp_path / "hello.tgz")
+    with open(archive_path, "wb") as f:
+        f.write(corrupt(data))
+
+    extract_dir = tmp_path / "extract"
+    with patch("patoolib.extract_archive") as extract_archive:
+        with pytest.raises(ValueError, match="Failed to uncompress archive"):
+            with tmp_extract(archive_path, dir=str(extract_dir), prefix="test-"):
+                pass
+
+    extract_archive.assert_not_called()
+    assert os.listdir(extract_dir) == []
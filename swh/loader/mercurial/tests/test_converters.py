@@ -58,6 +58,14 @@ class TestParseAuthorConverters(unittest.TestCase):
             {"name": b" ", "email": b"something", "fullname": b"  <something>"},
         )
 
+    def test_parse_author_7(self):
+        actual_author = converters.parse_author(b" <something>")
+
+        self.assertEqual(
+            actual_author,
+            {"name": b"", "email": b"something", "fullname": b" <something>"},
+        )
+
     def test_parse_author_normal(self):
         actual_author = converters.parse_author(b"someone <awesome>")
 
@@ -7,6 +7,7 @@ from hashlib import sha1
 import os
 from pathlib import Path
 import subprocess
+import tarfile
 import unittest
 
 import attr
@@ -26,7 +27,8 @@ from swh.model.swhids import ObjectType
 from swh.storage import get_storage
 from swh.storage.algos.snapshot import snapshot_get_latest
 
-from ..loader import EXTID_VERSION, HgDirectory, HgLoader
+from ..archive_extract import tmp_extract
+from ..loader import EXTID_VERSION, HgArchiveLoader, HgDirectory, HgLoader
 from .loader_checker import ExpectedSwhids, LoaderChecker
 
 VISIT_DATE = parse_visit_date("2016-05-03 15:16:32+00")
@@ -68,12 +70,112 @@ def test_hg_directory_deletes_empty_directories():
     assert directory.get(b"path/to/content") == content
 
 
+def test_hg_directory_delete_missing_path():
+    directory = HgDirectory()
+    directory[b"path/to/content"] = random_content()
+
+    with pytest.raises(KeyError):
+        del directory[b"path/to/missing"]
+
+    with pytest.raises(KeyError):
+        del directory[b"path/missing/content"]
+
+    assert directory.get(b"path/to/content") is not None
+
+
 def test_hg_directory_when_directory_replaces_file():
     directory = HgDirectory()
     directory[b"path/to/some"] = random_content()
     directory[b"path/to/some/content"] = random_content()
 
 
+def test_store_tree_only_stores_modified_directories(swh_storage):
+    loader = HgLoader(swh_storage, url="https://example.org/repo")
+    loader._last_root[b"path/to/content"] = random_content()
+    loader._last_root[b"other/content"] = random_content()
+    loader._store_tree()
+
+    loader._last_root[b"path/to/new-content"] = random_content()
+    with unittest.mock.patch.object(loader.storage, "directory_add") as directory_add:
+        root_id = loader._store_tree()
+
+    stored = {call.args[0][0].id for call in directory_add.call_args_list}
+    assert stored == {
+        loader._last_root.hash,
+        loader._last_root[b"path"].hash,
+        loader._last_root[b"path/to"].hash,
+    }
+    assert root_id == loader._last_root.hash
+
+
+def test_store_tree_after_directory_add_failure(swh_storage):
+    loader = HgLoader(swh_storage, url="https://example.org/repo")
+    loader._last_root[b"path/to/content"] = random_content()
+    loader._last_root[b"other/content"] = random_content()
+
+    directory_add = loader.storage.directory_add
+    calls = []
+
+    def failing_directory_add(directories):
+        calls.append(directories)
+        if len(calls) == 2:  # the first directory is stored, the second fails
+            raise RuntimeError("storage error")
+        return directory_add(directories)
+
+    with unittest.mock.patch.object(
+        loader.storage, "directory_add", side_effect=failing_directory_add
+    ):
+        with pytest.raises(RuntimeError):
+            loader._store_tree()
+
+    loader._store_tree()
+
+    directory_ids = [
+        loader._last_root.hash,
+        loader._last_root[b"path"].hash,
+        loader._last_root[b"path/to"].hash,
+        loader._last_root[b"other"].hash,
+    ]
+    assert list(swh_storage.directory_missing(directory_ids)) == []
+
+
+def test_loader_flags_only_change_reuses_content(swh_storage, tmp_path):
+    """A revision only changing file flags must reuse the cached content"""
+    repo = tmp_path / "repo"
+    subprocess.check_call(["hg", "init", str(repo)])
+    script = repo / "script"
+    script.write_bytes(b"#!/bin/sh\n")
+    script.chmod(0o644)
+    for message in ["add script", "make script executable"]:
+        subprocess.check_call(
+            ["hg", "commit", "-A", "-q", "-u", "test", "-d", "0 0", "-m", message],
+            cwd=repo,
+        )
+        script.chmod(0o755)
+
+    repo_url = f"file://{repo}"
+    loader = HgLoader(swh_storage, url=repo_url)
+    with unittest.mock.patch.object(
+        loader.storage, "content_add", wraps=loader.storage.content_add
+    ) as content_add:
+        assert loader.load() == {"status": "eventful"}
+
+    # the file data was read and hashed for the first revision only
+    content_add.assert_called_once()
+    (content,) = content_add.call_args.args[0]
+
+    snapshot = snapshot_get_latest(swh_storage, repo_url)
+    tip_id = snapshot.branches[b"branch-tip/default"].target
+    tip = swh_storage.revision_get([tip_id])[0]
+    parent = swh_storage.revision_get([tip.parents[0]])[0]
+
+    (parent_entry,) = swh_storage.directory_ls(parent.directory)
+    (tip_entry,) = swh_storage.directory_ls(tip.directory)
+    assert parent_entry["target"] == tip_entry["target"] == content.sha1_git
+    assert parent_entry["perms"] == DentryPerms.content
+    assert tip_entry["perms"] == DentryPerms.executable_content
+
+
 # Those tests assert expectations on repository loading
 # by reading expected values from associated json files
 # produced by the `swh-hg-identify` command line utility.
@@ -764,3 +866,72 @@ def test_loader_not_found_hg_repository(swh_storage, datadir, tmp_path):
         status="not_found",
         type="hg",
     )
+
+
+def test_archive_loader(swh_storage, datadir, tmp_path):
+    """Loading a repository from an archive extracts it and cleans it up"""
+    archive_path = os.path.join(datadir, "hello.tgz")
+    repo_url = "https://example.org/hello"
+    loader = HgArchiveLoader(
+        swh_storage,
+        url=repo_url,
+        archive_path=archive_path,
+        temp_directory=str(tmp_path),
+    )
+
+    assert loader.load() == {"status": "eventful"}
+    assert_last_visit_matches(
+        swh_storage,
+        repo_url,
+        status="full",
+        type="hg",
+    )
+    assert os.listdir(tmp_path) == []
+
+
+def test_archive_loader_empty_archive(swh_storage, tmp_path):
+    """An empty archive is reported explicitly"""
+    archive_path = str(tmp_path / "empty.tgz")
+    with tarfile.open(archive_path, "w:gz"):
+        pass
+    loader = HgArchiveLoader(
+        swh_storage,
+        url="https://example.org/empty",
+        archive_path=archive_path,
+        temp_directory=str(tmp_path / "tmp"),
+    )
+
+    with pytest.raises(ValueError, match="is empty"):
+        loader.prepare()
+
+    loader._archive_extract_stack.close()
+    assert os.listdir(tmp_path / "tmp") == []
+
+
+def test_archive_loader_cleanup_error(swh_storage, datadir, tmp_path):
+    """The extracted archive is removed even if the default cleanup fails"""
+    loader = HgArchiveLoader(
+        swh_storage,
+        url="https://example.org/hello",
+        archive_path=os.path.join(datadir, "hello.tgz"),
+        temp_directory=str(tmp_path),
+    )
+    loader._archive_extract_stack.enter_context(
+        tmp_extract(loader.archive_path, dir=str(tmp_path))
+    )
+    assert os.listdir(tmp_path) != []
+
+    with unittest.mock.patch.object(
+        HgLoader, "cleanup", side_effect=AttributeError("old_environ")
+    ):
+        with pytest.raises(AttributeError):
+            loader.cleanup()
+
+    assert os.listdir(tmp_path) == []
+
+
+def test_loader_default_temp_directory(swh_storage, tmp_path, monkeypatch):
+    """Without an explicit temp_directory, the system temporary directory is used"""
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+    loader = HgLoader(swh_storage, url="https://example.org/hello")
+    assert loader._temp_directory == str(tmp_path)